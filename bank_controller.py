@@ -1,11 +1,17 @@
-from fastapi import HTTPException
+from fastapi import Header, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Literal
 from enum import Enum
 import asyncio
+from collections import defaultdict, deque
 import random
-import json
-from datetime import datetime, timezone
+import time
+import mmap
+import hmac
+import heapq
+import itertools
+import orjson
+from datetime import date, datetime, timezone
 from pathlib import Path
 from decimal import Decimal, ROUND_HALF_UP
 import os
@@ -14,9 +20,25 @@ import os
 DATA_DIR = Path("./bank_data")
 DATA_DIR.mkdir(exist_ok=True)
 
+# Transactions are sharded by UTC day (transactions/YYYY-MM-DD.jsonl) so date
+# bounded reads only open the days they need. TRANSACTIONS_FILE is the old
+# single-file log; if one is found at startup it is split into shards.
+TRANSACTIONS_DIR = DATA_DIR / "transactions"
+TRANSACTIONS_DIR.mkdir(exist_ok=True)
 TRANSACTIONS_FILE = DATA_DIR / "transactions.jsonl"
-PAYMENTS_FILE = DATA_DIR / "payments.json"
-ALERTS_FILE = DATA_DIR / "alerts.json"
+PAYMENTS_FILE = DATA_DIR / "payments.jsonl"
+ALERTS_FILE = DATA_DIR / "alerts.jsonl"
+# Payments and alerts used to be rewritten whole as JSON arrays; if these are
+# found at startup they become the initial event logs.
+LEGACY_PAYMENTS_FILE = DATA_DIR / "payments.json"
+LEGACY_ALERTS_FILE = DATA_DIR / "alerts.json"
+LOG_COMPACT_INTERVAL = 600  # seconds
+# Log sizes right after their last snapshot; unchanged logs aren't rewritten
+_SNAPSHOT_SIZES: dict[Path, int] = {}
+
+# Read once at import; requests are only checked when a key is configured
+_API_KEY = os.environ.get("API_KEY")
+_API_KEY_BYTES = _API_KEY.encode() if _API_KEY else b""
 
 
 # ==================== Models ====================
@@ -88,124 +110,401 @@ class FXRate(BaseModel):
 
 # ==================== Data Storage ====================
 
-# In-memory stores
+# In-memory stores. Balances are held as integer cents and FX rates as integer
+# basis points (1/10000); both are only formatted at the serialization boundary.
 ACCOUNTS = {
     "op_aud": {
         "account_id": "op_aud",
         "account_name": "Operating Account",
         "currency": "AUD",
-        "balance": Decimal("16532.45"),
+        "balance": 1653245,
     },
     "sav_aud": {
         "account_id": "sav_aud",
         "account_name": "Savings Account",
         "currency": "AUD",
-        "balance": Decimal("120432.10"),
+        "balance": 12043210,
     },
     "exp_usd": {
         "account_id": "exp_usd",
         "account_name": "Export Reserve",
         "currency": "USD",
-        "balance": Decimal("8750.67"),
+        "balance": 875067,
     },
 }
+_ACCOUNT_KEYS = tuple(ACCOUNTS)
+
+# Payments and alerts are always plain JSON-ready dicts (never models), so they
+# can be handed to orjson as-is
+PENDING_PAYMENTS: list[dict] = []
+_PAYMENTS_BY_ID: dict[str, dict] = {}
+# Upcoming payment status transitions as (due unix time, payment_id, next status)
+_due_heap: list[tuple[float, str, str]] = []
+PAYMENT_PROCESS_AFTER = 30  # seconds after creation
+PAYMENT_COMPLETE_AFTER = 60
+PAYMENT_POLL_INTERVAL = 15  # seconds
+FX_UPDATE_INTERVAL = 120  # seconds
+# Most recent transactions, oldest first, serving /transactions. The JSONL
+# shards stay the durable log; they are read back at startup to fill this and
+# streamed by /transactions/history.
+TXN_RECENT_MAX = 2048
+TRANSACTIONS_RECENT = deque(maxlen=TXN_RECENT_MAX)
+# The same transactions indexed by account_id, for filtered /transactions
+_TXN_BY_ACCT: defaultdict[str, deque] = defaultdict(
+    lambda: deque(maxlen=TXN_RECENT_MAX)
+)
+ALERTS: list[dict] = []
+FX_RATES = {"AUD_USD": 6500, "USD_AUD": 15400}
+# pair -> (from currency, to currency)
+_FX_PAIR_SPLITS = {pair: tuple(pair.split("_")) for pair in FX_RATES}
+
+# ID counters (bound __next__ of itertools.count); reseeded in startup()
+_txn_next = itertools.count(1).__next__
+_payment_next = itertools.count(1).__next__
+_alert_next = itertools.count(1).__next__
+
+# Append stream for the current day's shard, open between startup() and
+# shutdown() and rotated by save_transaction when the UTC date changes.
+# Simulated transactions are group-committed: they sit in the buffer until the
+# flusher writes and fsyncs them once per TXN_FLUSH_INTERVAL. Only payment
+# completions force an immediate fsync.
+_txn_fp = None
+_txn_day: str | None = None
+# fsyncs of rotated-out shards still running in worker threads
+_shard_syncs: set[asyncio.Future] = set()
+TXN_WRITE_BUFFER = 1 << 20
+TXN_FLUSH_INTERVAL = 1  # seconds
+# How much of the log to read at startup; enough to fill TRANSACTIONS_RECENT
+TXN_TAIL_BYTES = 512 * 1024
+TXN_STREAM_CHUNK = 64 * 1024
+
+# Pre-serialized responses for /balances and /fx/rates, rebuilt only after the
+# background tasks change the underlying data. Balances are rebuilt lazily on
+# the next request; FX rates are rebuilt by update_fx_rates itself.
+_BALANCES_CACHE: bytes | None = None
+_BALANCES_DIRTY = True
+_FX_RATES_CACHE: bytes | None = None
+
+# Dedicated RNG for the simulators, with bound methods cached to skip the
+# module-level lookups in the hot loops
+_rng = random.Random()
+_uniform = _rng.uniform
+_choice = _rng.choice
+_rnd = _rng.random
+
+# Last time (monotonic) an alert was raised per (account_id, kind). A persistently
+# low account would otherwise raise a new alert on every simulator tick.
+_LAST_ALERT: dict[tuple[str, str], float] = {}
+ALERT_DEBOUNCE = 300  # seconds
+
+OP_DESCRIPTIONS = (
+    "Customer payment received",
+    "Supplier payment",
+    "Payroll transfer",
+    "Tax payment",
+    "Utility bill",
+)
 
-PENDING_PAYMENTS = []
-ALERTS = []
-FX_RATES = {"AUD_USD": Decimal("0.65"), "USD_AUD": Decimal("1.54")}
 
-# Counters
-TRANSACTION_COUNTER = 0
-PAYMENT_COUNTER = 0
-ALERT_COUNTER = 0
+# ==================== Helpers ====================
 
 
-# ==================== Helpers ====================
+def quantize_amount(cents: int):
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
 
 
-def quantize_amount(d: Decimal):
-    return str(d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+def parse_amount(amount: str) -> int:
+    """Convert a decimal amount string (e.g. a payment amount) to integer cents"""
+    return int((Decimal(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP))
 
 
 def generate_transaction_id():
-    global TRANSACTION_COUNTER
-    TRANSACTION_COUNTER += 1
-    return f"TXN{TRANSACTION_COUNTER:08d}"
+    return "TXN%08d" % _txn_next()
 
 
 def generate_payment_id():
-    global PAYMENT_COUNTER
-    PAYMENT_COUNTER += 1
-    return f"PAY{PAYMENT_COUNTER:08d}"
+    return "PAY%08d" % _payment_next()
 
 
 def generate_alert_id():
-    global ALERT_COUNTER
-    ALERT_COUNTER += 1
-    return f"ALT{ALERT_COUNTER:08d}"
+    return "ALT%08d" % _alert_next()
+
+
+def _id_number(record_id: str) -> int:
+    """Numeric part of an ID such as TXN00000042"""
+    return int(record_id[3:])
+
+
+def _txn_shard_path(day: str) -> Path:
+    return TRANSACTIONS_DIR / f"{day}.jsonl"
+
+
+def _txn_shards(since: Optional[date] = None) -> list[Path]:
+    """Transaction shards oldest first, skipping days before `since`"""
+    shards = sorted(TRANSACTIONS_DIR.glob("*.jsonl"))
+    if since is not None:
+        first = _txn_shard_path(since.isoformat()).name
+        shards = [p for p in shards if p.name >= first]
+    return shards
+
+
+def _open_txn_shard(day: str):
+    """Point the append stream at `day`'s shard, syncing the previous one"""
+    global _txn_fp, _txn_day
+    if _txn_fp is not None:
+        _txn_fp.flush()
+        fd = os.dup(_txn_fp.fileno())
+        _txn_fp.close()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            _fsync_fd(fd)
+        else:
+            # fsync the finished shard from a worker thread; shutdown() waits on it
+            fut = loop.run_in_executor(None, _fsync_fd, fd)
+            _shard_syncs.add(fut)
+            fut.add_done_callback(_shard_syncs.discard)
+    _txn_fp = open(_txn_shard_path(day), "ab", buffering=TXN_WRITE_BUFFER)
+    _txn_day = day
+
+
+def migrate_transactions_file():
+    """Split the legacy single-file log into day shards, then remove it.
+
+    Each shard is written whole and renamed into place, and days that already
+    have a shard are skipped, so a migration interrupted partway can simply be
+    rerun without duplicating transactions.
+    """
+    if not TRANSACTIONS_FILE.exists():
+        return
+    by_day: dict[str, list[bytes]] = defaultdict(list)
+    with open(TRANSACTIONS_FILE, "rb") as f:
+        for line in f:
+            if line.strip():
+                day = orjson.loads(line)["timestamp"][:10]
+                by_day[day].append(line.rstrip(b"\n") + b"\n")
+    for day, lines in by_day.items():
+        shard = _txn_shard_path(day)
+        if shard.exists():
+            continue
+        tmp = shard.with_suffix(".jsonl.tmp")
+        _write_synced(tmp, b"".join(lines))
+        os.replace(tmp, shard)
+    _fsync_dir(TRANSACTIONS_DIR)
+    TRANSACTIONS_FILE.unlink()
 
 
 def save_transaction(txn_dict):
-    """Append transaction to JSONL file"""
-    with open(TRANSACTIONS_FILE, "a") as f:
-        f.write(json.dumps(txn_dict) + "\n")
+    """Append transaction to its day shard's write buffer"""
+    # ISO timestamps are UTC, so the first 10 chars are the shard's date
+    day = txn_dict["timestamp"][:10]
+    if day != _txn_day:
+        _open_txn_shard(day)
+    _txn_fp.write(orjson.dumps(txn_dict) + b"\n")
+
+
+def flush_transactions():
+    """Push buffered transactions to the current shard (see sync_transactions)"""
+    if _txn_fp is not None:
+        _txn_fp.flush()
+
+
+def _read_tail(path: Path, tail_bytes: int) -> tuple[bytes, bool]:
+    """Last `tail_bytes` of a JSONL file, starting on a line boundary.
+
+    Always includes the file's last line, even if it alone is over budget.
+    Also returns whether the tail is the whole file.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return b"", True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = max(0, size - tail_bytes)
+            if start:
+                # Skip the partial line we landed in
+                start = mm.find(b"\n", start - 1) + 1
+                if not start or start >= size - 1:
+                    start = mm.rfind(b"\n", 0, size - 1) + 1
+            return mm[start:], start == 0
+
+
+def _fsync_fd(fd: int):
+    """fsync and close a descriptor the caller handed over"""
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
-def load_transactions():
-    """Load all transactions from file"""
-    if not TRANSACTIONS_FILE.exists():
-        return []
+async def sync_transactions():
+    """Flush buffered transactions and fsync them from a worker thread"""
+    if _txn_fp is None:
+        return
+    _txn_fp.flush()
+    # fsync a duplicate so a shard rotation closing _txn_fp can't pull the fd away
+    await asyncio.to_thread(_fsync_fd, os.dup(_txn_fp.fileno()))
+
+
+def load_transactions(tail_bytes: int = TXN_TAIL_BYTES):
+    """Load the most recent transactions from the last `tail_bytes` of the log"""
+    tails = []
+    for path in reversed(_txn_shards()):
+        if tail_bytes <= 0:
+            break
+        tail, whole = _read_tail(path, tail_bytes)
+        tails.append(tail)
+        if not whole:
+            # Older shards would leave a gap before this tail
+            break
+        tail_bytes -= len(tail)
     transactions = []
-    with open(TRANSACTIONS_FILE, "r") as f:
-        for line in f:
+    for tail in reversed(tails):
+        for line in tail.split(b"\n"):
             if line.strip():
-                transactions.append(json.loads(line))
+                transactions.append(orjson.loads(line))
     return transactions
 
 
-def save_payments():
-    """Save payments to JSON file"""
-    with open(PAYMENTS_FILE, "w") as f:
-        json.dump(
-            [p.__dict__ if hasattr(p, "__dict__") else p for p in PENDING_PAYMENTS],
-            f,
-            indent=2,
-        )
+def iter_transaction_history(
+    since: Optional[date] = None, chunk_size: int = TXN_STREAM_CHUNK
+):
+    """Yield the transaction shards from `since` onwards in raw chunks, oldest first.
 
+    Only reads files, so it is safe to iterate from a worker thread; call
+    flush_transactions() on the event loop first to include buffered records.
+    """
+    for path in _txn_shards(since):
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
 
-def load_payments():
-    """Load payments from JSON file"""
-    if not PAYMENTS_FILE.exists():
+
+def _append_events(path: Path, events: list[dict]):
+    with open(path, "ab") as f:
+        f.write(b"".join(orjson.dumps(e) + b"\n" for e in events))
+
+
+def _write_synced(path: Path, data: bytes):
+    """Write `data` to a fresh file and fsync it"""
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path: Path):
+    """fsync a directory so renames inside it survive a crash"""
+    if os.name == "nt":  # Directories can't be opened (or fsynced) on Windows
+        return
+    _fsync_fd(os.open(path, os.O_RDONLY))
+
+
+def _log_size(path: Path) -> int:
+    return path.stat().st_size if path.exists() else 0
+
+
+async def _write_snapshot(path: Path, records: list):
+    """Atomically replace an event log with one full record per line.
+
+    The snapshot is written and fsynced from a worker thread. If events were
+    appended to the log meanwhile it is retaken, so the rename never drops them.
+    Skipped when nothing was appended since the last snapshot.
+    """
+    if _log_size(path) == _SNAPSHOT_SIZES.get(path, 0):
+        return
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    while True:
+        size = _log_size(path)
+        data = b"".join(orjson.dumps(r) + b"\n" for r in records)
+        await asyncio.to_thread(_write_synced, tmp, data)
+        if _log_size(path) == size:
+            break
+    os.replace(tmp, path)
+    await asyncio.to_thread(_fsync_dir, path.parent)
+    _SNAPSHOT_SIZES[path] = len(data)
+
+
+def _migrate_legacy_log(legacy: Path, path: Path):
+    """Turn a legacy JSON array file into the initial event log, then remove it.
+
+    Skipped once the event log exists, so an interrupted migration can be rerun.
+    """
+    if path.exists() or not legacy.exists():
+        return
+    with open(legacy, "rb") as f:
+        records = orjson.loads(f.read())
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    _write_synced(tmp, b"".join(orjson.dumps(r) + b"\n" for r in records))
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+    legacy.unlink()
+
+
+def _replay_log(path: Path, key: str):
+    """Rebuild records from an event log; later events patch earlier ones"""
+    if not path.exists():
         return []
-    with open(PAYMENTS_FILE, "r") as f:
-        return json.load(f)
+    records = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                event = orjson.loads(line)
+                records.setdefault(event[key], {}).update(event)
+    return list(records.values())
 
 
-def save_alerts():
-    """Save alerts to JSON file"""
-    with open(ALERTS_FILE, "w") as f:
-        json.dump(
-            [a.__dict__ if hasattr(a, "__dict__") else a for a in ALERTS], f, indent=2
-        )
+def append_payment_events(events: list[dict]):
+    """Append new payments or partial updates (each must include payment_id)"""
+    _append_events(PAYMENTS_FILE, events)
+
+
+async def sync_payments():
+    """fsync the payments log from a worker thread"""
+    fd = os.open(PAYMENTS_FILE, os.O_WRONLY | os.O_APPEND)
+    await asyncio.to_thread(_fsync_fd, fd)
+
+
+async def save_payments():
+    """Compact the payments log into a snapshot of current state"""
+    await _write_snapshot(PAYMENTS_FILE, PENDING_PAYMENTS)
+
+
+def load_payments():
+    """Load payments by replaying the payments log"""
+    return _replay_log(PAYMENTS_FILE, "payment_id")
+
+
+def append_alert_event(event: dict):
+    """Append a new alert or a partial update (must include alert_id)"""
+    _append_events(ALERTS_FILE, [event])
+
+
+async def save_alerts():
+    """Compact the alerts log into a snapshot of current state"""
+    await _write_snapshot(ALERTS_FILE, ALERTS)
 
 
 def load_alerts():
-    """Load alerts from JSON file"""
-    if not ALERTS_FILE.exists():
-        return []
-    with open(ALERTS_FILE, "r") as f:
-        return json.load(f)
+    """Load alerts by replaying the alerts log"""
+    return _replay_log(ALERTS_FILE, "alert_id")
 
 
 def record_transaction(
-    account_id: str, amount: Decimal, txn_type: str, description: str
+    account_id: str,
+    amount: int,
+    txn_type: str,
+    description: str,
+    ts: Optional[str] = None,
 ):
     """Record a transaction and save to file"""
     acct = ACCOUNTS[account_id]
     txn = {
         "transaction_id": generate_transaction_id(),
         "account_id": account_id,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "timestamp": ts or datetime.now(timezone.utc).isoformat(),
         "amount": quantize_amount(abs(amount)),
         "type": txn_type,
         "description": description,
@@ -213,159 +512,252 @@ def record_transaction(
         "currency": acct["currency"],
     }
     save_transaction(txn)
+    _index_transaction(txn)
     return txn
 
 
-def check_alerts(account_id: str):
+def _index_transaction(txn: dict):
+    TRANSACTIONS_RECENT.append(txn)
+    _TXN_BY_ACCT[txn["account_id"]].append(txn)
+
+
+def _alert_due(key: tuple[str, str], now: float) -> bool:
+    """Return True (and stamp the key) unless the same alert fired recently"""
+    if now - _LAST_ALERT.get(key, float("-inf")) < ALERT_DEBOUNCE:
+        return False
+    _LAST_ALERT[key] = now
+    return True
+
+
+def check_alerts(account_id: str, ts: Optional[str] = None):
     """Check and create alerts for an account"""
     acct = ACCOUNTS[account_id]
     balance = acct["balance"]
+    if balance < 500000 and ts is None:
+        ts = datetime.now(timezone.utc).isoformat()
+    now = time.monotonic()
 
     # Low balance alert
-    if balance < Decimal("5000") and acct["currency"] == "AUD":
-        alert = {
-            "alert_id": generate_alert_id(),
-            "account_id": account_id,
-            "severity": "high" if balance < Decimal("2000") else "medium",
-            "message": f"Low balance warning: {acct['account_name']} has {quantize_amount(balance)} {acct['currency']}",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "acknowledged": False,
-        }
-        ALERTS.append(alert)
-        save_alerts()
+    if balance < 500000 and acct["currency"] == "AUD":
+        severity = "high" if balance < 200000 else "medium"
+        if _alert_due((account_id, severity), now):
+            alert = {
+                "alert_id": generate_alert_id(),
+                "account_id": account_id,
+                "severity": severity,
+                "message": f"Low balance warning: {acct['account_name']} has {quantize_amount(balance)} {acct['currency']}",
+                "timestamp": ts,
+                "acknowledged": False,
+            }
+            ALERTS.append(alert)
+            append_alert_event(alert)
 
     # Overdraft alert
-    if balance < Decimal("0"):
+    if balance < 0 and _alert_due((account_id, "overdraft"), now):
         alert = {
             "alert_id": generate_alert_id(),
             "account_id": account_id,
             "severity": "high",
             "message": f"OVERDRAFT: {acct['account_name']} is {quantize_amount(abs(balance))} {acct['currency']} overdrawn",
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": ts,
             "acknowledged": False,
         }
         ALERTS.append(alert)
-        save_alerts()
+        append_alert_event(alert)
+
+
+def schedule_payment(payment: dict):
+    """Queue the next status transition for a pending or processing payment.
+
+    New payments should set `created_ts` (unix time) alongside `created_at`;
+    older records get it derived from `created_at` once here.
+    """
+    created = payment.get("created_ts")
+    if created is None:
+        created = payment["created_ts"] = datetime.fromisoformat(
+            payment["created_at"]
+        ).timestamp()
+    payment_id = payment["payment_id"]
+    _PAYMENTS_BY_ID[payment_id] = payment
+    if payment["status"] == "pending":
+        due = (created + PAYMENT_PROCESS_AFTER, payment_id, "processing")
+    elif payment["status"] == "processing":
+        due = (created + PAYMENT_COMPLETE_AFTER, payment_id, "completed")
+    else:
+        return
+    heapq.heappush(_due_heap, due)
 
 
 # ==================== Background Tasks ====================
 
 
-async def balance_simulator():
-    """Random-walk style updates to balances"""
+def simulate_balance_step():
+    """Apply one random-walk style update to a random account"""
+    global _BALANCES_DIRTY
+    now_iso = datetime.now(timezone.utc).isoformat()
+    acct_key = _choice(_ACCOUNT_KEYS)
+    acct = ACCOUNTS[acct_key]
+    base = acct["balance"]
+
+    # Generate realistic change
+    if acct_key == "op_aud":
+        if _rnd() < 0.3:
+            change = round(_uniform(-300000, 500000))
+            desc = _choice(OP_DESCRIPTIONS)
+        else:
+            change = round(base * _uniform(-0.02, 0.03))
+            desc = "Operating activity"
+    elif acct_key == "sav_aud":
+        change = round(_uniform(-50000, 200000))
+        desc = "Interest earned" if change > 0 else "Transfer to operating"
+    else:  # exp_usd
+        if _rnd() < 0.15:
+            change = round(_uniform(50000, 800000))
+            desc = "Export receipt"
+        else:
+            change = round(_uniform(-20000, 50000))
+            desc = "International payment"
+
+    acct["balance"] += change
+    if acct["balance"] < -500000:
+        acct["balance"] = -500000
+
+    acct["last_updated"] = now_iso
+
+    # Record transaction
+    txn_type = "credit" if change > 0 else "debit"
+    record_transaction(acct_key, change, txn_type, desc, ts=now_iso)
+
+    # Check for alerts
+    check_alerts(acct_key, ts=now_iso)
+
+    _BALANCES_DIRTY = True
+
+
+def process_due_payments(now: float):
+    """Apply every payment status transition due at or before `now`.
+
+    Status changes are logged in one append at the end of the call. Returns
+    True if any payment completed, in which case the caller must fsync the
+    payments and transaction logs (see sync_payments/sync_transactions).
+    """
+    global _BALANCES_DIRTY
+    if not _due_heap or _due_heap[0][0] > now:
+        return False
+    # One timestamp for every transition applied in this call
+    now_iso = datetime.now(timezone.utc).isoformat()
+    events = []
+    completed = False
+    while _due_heap and _due_heap[0][0] <= now:
+        _, payment_id, next_status = heapq.heappop(_due_heap)
+        payment = _PAYMENTS_BY_ID.get(payment_id)
+        if payment is None:
+            continue
+
+        if next_status == "processing":
+            payment["status"] = "processing"
+            events.append({"payment_id": payment_id, "status": "processing"})
+            schedule_payment(payment)
+            continue
+
+        # Deduct from account
+        from_acct = payment["from_account"]
+        if from_acct in ACCOUNTS:
+            amount = parse_amount(payment["amount"])
+            ACCOUNTS[from_acct]["balance"] -= amount
+            _BALANCES_DIRTY = True
+
+            record_transaction(
+                from_acct,
+                -amount,
+                "debit",
+                f"Payment to {payment['to_reference']}: {payment['description']}",
+                ts=now_iso,
+            )
+
+            check_alerts(from_acct, ts=now_iso)
+
+        payment["status"] = "completed"
+        payment["processed_at"] = now_iso
+        events.append(
+            {
+                "payment_id": payment_id,
+                "status": "completed",
+                "processed_at": now_iso,
+            }
+        )
+        completed = True
+
+    if events:
+        append_payment_events(events)
+    return completed
+
+
+def update_fx_rates():
+    """Simulate small FX movements"""
+    for pair in FX_RATES:
+        current = FX_RATES[pair]
+        change_pct = _uniform(-0.005, 0.005)  # +/- 0.5%
+        FX_RATES[pair] = round(current * (1 + change_pct))
+    refresh_fx_rates_cache()
+
+
+async def _sim_scheduler():
+    """Single task driving the balance simulator, payments and FX updates.
+
+    The simulator and FX jobs keep their next-fire times on the monotonic
+    clock, so wall-clock steps can't stall them; the payment heap is keyed by
+    unix time and compared against time.time(). The task sleeps until the
+    earliest job is due.
+    """
     try:
+        mono = time.monotonic()
+        next_sim = mono
+        next_fx = mono + FX_UPDATE_INTERVAL
         while True:
-            acct_key = random.choice(list(ACCOUNTS.keys()))
-            acct = ACCOUNTS[acct_key]
-            base = acct["balance"]
-
-            # Generate realistic change
-            if acct_key == "op_aud":
-                if random.random() < 0.3:
-                    change = Decimal(random.uniform(-3000, 5000)).quantize(
-                        Decimal("0.01")
-                    )
-                    desc = random.choice(
-                        [
-                            "Customer payment received",
-                            "Supplier payment",
-                            "Payroll transfer",
-                            "Tax payment",
-                            "Utility bill",
-                        ]
-                    )
-                else:
-                    vol_pct = random.uniform(-0.02, 0.03)
-                    change = (base * Decimal(str(vol_pct))).quantize(Decimal("0.01"))
-                    desc = "Operating activity"
-            elif acct_key == "sav_aud":
-                change = Decimal(random.uniform(-500, 2000)).quantize(Decimal("0.01"))
-                desc = "Interest earned" if change > 0 else "Transfer to operating"
-            else:  # exp_usd
-                if random.random() < 0.15:
-                    change = Decimal(random.uniform(500, 8000)).quantize(
-                        Decimal("0.01")
-                    )
-                    desc = "Export receipt"
-                else:
-                    change = Decimal(random.uniform(-200, 500)).quantize(
-                        Decimal("0.01")
-                    )
-                    desc = "International payment"
-
-            acct["balance"] = (acct["balance"] + change).quantize(Decimal("0.01"))
-            if acct["balance"] < Decimal("-5000"):
-                acct["balance"] = Decimal("-5000.00")
-
-            acct["last_updated"] = datetime.now(timezone.utc).isoformat()
-
-            # Record transaction
-            txn_type = "credit" if change > 0 else "debit"
-            record_transaction(acct_key, change, txn_type, desc)
-
-            # Check for alerts
-            check_alerts(acct_key)
-
-            await asyncio.sleep(random.uniform(20, 90))
+            mono = time.monotonic()
+            # Capped so payments scheduled meanwhile are picked up promptly
+            delay = min(next_sim - mono, next_fx - mono, PAYMENT_POLL_INTERVAL)
+            if _due_heap:
+                delay = min(delay, _due_heap[0][0] - time.time())
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            mono = time.monotonic()
+            if mono >= next_sim:
+                simulate_balance_step()
+                next_sim = mono + _uniform(20, 90)
+            if process_due_payments(time.time()):
+                # fsync off the event loop so requests aren't stalled on disk
+                await asyncio.gather(sync_payments(), sync_transactions())
+            if mono >= next_fx:
+                update_fx_rates()
+                next_fx = mono + FX_UPDATE_INTERVAL
     except asyncio.CancelledError:
         return
 
 
-async def payment_processor():
-    """Process pending payments"""
+async def _txn_flusher():
+    """Periodically write and fsync buffered transactions"""
+    synced_at = None
     try:
         while True:
-            await asyncio.sleep(15)  # Check every 15 seconds
-
-            for payment in PENDING_PAYMENTS[:]:
-                if payment["status"] != "pending":
-                    continue
-
-                # Simulate processing delay
-                created = datetime.fromisoformat(payment["created_at"])
-                age = (datetime.now(timezone.utc) - created).total_seconds()
-
-                if age > 30:  # Process after 30 seconds
-                    payment["status"] = "processing"
-                    save_payments()
-
-                if age > 60:  # Complete after 60 seconds
-                    # Deduct from account
-                    from_acct = payment["from_account"]
-                    if from_acct in ACCOUNTS:
-                        amount = Decimal(payment["amount"])
-                        ACCOUNTS[from_acct]["balance"] -= amount
-
-                        record_transaction(
-                            from_acct,
-                            -amount,
-                            "debit",
-                            f"Payment to {payment['to_reference']}: {payment['description']}",
-                        )
-
-                        check_alerts(from_acct)
-
-                    payment["status"] = "completed"
-                    payment["processed_at"] = datetime.now(timezone.utc).isoformat()
-                    save_payments()
+            await asyncio.sleep(TXN_FLUSH_INTERVAL)
+            if _txn_fp is None or (_txn_day, _txn_fp.tell()) == synced_at:
+                continue
+            synced_at = (_txn_day, _txn_fp.tell())
+            await sync_transactions()
     except asyncio.CancelledError:
         return
 
 
-async def fx_rate_updater():
-    """Update FX rates periodically"""
+async def _log_compactor():
+    """Periodically rewrite the payment/alert logs as fresh snapshots"""
     try:
         while True:
-            await asyncio.sleep(120)  # Update every 2 minutes
-
-            # Simulate small FX movements
-            for pair in FX_RATES:
-                current = FX_RATES[pair]
-                change_pct = Decimal(str(random.uniform(-0.005, 0.005)))  # +/- 0.5%
-                new_rate = (current * (Decimal("1") + change_pct)).quantize(
-                    Decimal("0.0001")
-                )
-                FX_RATES[pair] = new_rate
+            await asyncio.sleep(LOG_COMPACT_INTERVAL)
+            await save_payments()
+            await save_alerts()
     except asyncio.CancelledError:
         return
 
@@ -373,83 +765,123 @@ async def fx_rate_updater():
 # ==================== Lifecycle helpers ====================
 
 
-def check_api_key(x_api_key: str | None):
-    API_KEY = os.environ.get("API_KEY", None)
-    if API_KEY:
-        if not x_api_key or x_api_key != API_KEY:
-            raise HTTPException(status_code=401, detail="Invalid or missing API key")
+async def check_api_key(x_api_key: str | None = Header(None)):
+    """FastAPI dependency rejecting requests without the configured API key"""
+    if _API_KEY and not (
+        x_api_key and hmac.compare_digest(x_api_key.encode(), _API_KEY_BYTES)
+    ):
+        raise HTTPException(status_code=401, detail="Invalid or missing API key")
 
 
 def get_balances():
-    out = []
-    for acct in ACCOUNTS.values():
-        out.append(
-            AccountBalance(
-                account_id=acct["account_id"],
-                account_name=acct["account_name"],
-                currency=acct["currency"],
-                balance=quantize_amount(acct["balance"]),
-                last_updated=acct.get(
-                    "last_updated", datetime.now(timezone.utc).isoformat()
-                ),
+    global _BALANCES_CACHE, _BALANCES_DIRTY
+    if _BALANCES_DIRTY or _BALANCES_CACHE is None:
+        out = []
+        for acct in ACCOUNTS.values():
+            out.append(
+                {
+                    "account_id": acct["account_id"],
+                    "account_name": acct["account_name"],
+                    "currency": acct["currency"],
+                    "balance": quantize_amount(acct["balance"]),
+                    "last_updated": acct["last_updated"],
+                }
             )
-        )
-    return out
+        _BALANCES_CACHE = orjson.dumps(out)
+        _BALANCES_DIRTY = False
+    return _BALANCES_CACHE
 
 
 def get_balance(account_id: str):
     acct = ACCOUNTS.get(account_id)
     if not acct:
         raise HTTPException(status_code=404, detail="Account not found")
-    return AccountBalance(
-        account_id=acct["account_id"],
-        account_name=acct["account_name"],
-        currency=acct["currency"],
-        balance=quantize_amount(acct["balance"]),
-        last_updated=acct.get("last_updated", datetime.now(timezone.utc).isoformat()),
-    )
+    return {
+        "account_id": acct["account_id"],
+        "account_name": acct["account_name"],
+        "currency": acct["currency"],
+        "balance": quantize_amount(acct["balance"]),
+        "last_updated": acct["last_updated"],
+    }
 
 
 def get_transactions(account_id: Optional[str] = None, limit: int = 100):
-    all_txns = load_transactions()
     if account_id:
-        all_txns = [t for t in all_txns if t["account_id"] == account_id]
-    all_txns = all_txns[-limit:][::-1]
-    return [Transaction(**t) for t in all_txns]
+        recent = _TXN_BY_ACCT.get(account_id, ())
+    else:
+        recent = TRANSACTIONS_RECENT
+    return list(itertools.islice(reversed(recent), limit))
 
 
-def get_fx_rates():
+def refresh_fx_rates_cache():
+    """Re-serialize FX_RATES for /fx/rates, stamped with the current time"""
+    global _FX_RATES_CACHE
+    now_iso = datetime.now(timezone.utc).isoformat()
     rates = []
     for pair, rate in FX_RATES.items():
-        from_curr, to_curr = pair.split("_")
+        from_curr, to_curr = _FX_PAIR_SPLITS[pair]
         rates.append(
-            FXRate(
-                from_currency=from_curr,
-                to_currency=to_curr,
-                rate=quantize_amount(rate),
-                last_updated=datetime.now(timezone.utc).isoformat(),
-            )
+            {
+                "from_currency": from_curr,
+                "to_currency": to_curr,
+                # Basis points -> cents, rounding half up
+                "rate": quantize_amount((rate + 50) // 100),
+                "last_updated": now_iso,
+            }
         )
-    return rates
+    _FX_RATES_CACHE = orjson.dumps(rates)
+
+
+def get_fx_rates():
+    if _FX_RATES_CACHE is None:
+        refresh_fx_rates_cache()
+    return _FX_RATES_CACHE
 
 
 async def startup(app):
-    global PENDING_PAYMENTS, ALERTS, TRANSACTION_COUNTER
+    global PENDING_PAYMENTS, ALERTS, _txn_next, _payment_next, _alert_next
 
+    _migrate_legacy_log(LEGACY_PAYMENTS_FILE, PAYMENTS_FILE)
+    _migrate_legacy_log(LEGACY_ALERTS_FILE, ALERTS_FILE)
     PENDING_PAYMENTS = load_payments()
+    for payment in PENDING_PAYMENTS:
+        schedule_payment(payment)
     ALERTS = load_alerts()
 
+    # Resume ID numbering after the highest persisted IDs
+    last_payment = max(
+        (_id_number(p["payment_id"]) for p in PENDING_PAYMENTS), default=0
+    )
+    _payment_next = itertools.count(last_payment + 1).__next__
+    last_alert = max((_id_number(a["alert_id"]) for a in ALERTS), default=0)
+    _alert_next = itertools.count(last_alert + 1).__next__
+
+    # Accounts the simulator hasn't touched yet report the startup time
+    now_iso = datetime.now(timezone.utc).isoformat()
+    for acct in ACCOUNTS.values():
+        acct.setdefault("last_updated", now_iso)
+
+    migrate_transactions_file()
     transactions = load_transactions()
     if transactions:
-        TRANSACTION_COUNTER = len(transactions)
+        # Only the tail is loaded, so resume numbering from the last ID
+        last_txn = _id_number(transactions[-1]["transaction_id"])
+        _txn_next = itertools.count(last_txn + 1).__next__
+        for txn in transactions[-TXN_RECENT_MAX:]:
+            _index_transaction(txn)
+
+    _open_txn_shard(datetime.now(timezone.utc).date().isoformat())
+    refresh_fx_rates_cache()
 
-    app.state.simulator_task = asyncio.create_task(balance_simulator())
-    app.state.payment_task = asyncio.create_task(payment_processor())
-    app.state.fx_task = asyncio.create_task(fx_rate_updater())
+    app.state.scheduler_task = asyncio.create_task(_sim_scheduler())
+    app.state.txn_flush_task = asyncio.create_task(_txn_flusher())
+    app.state.compact_task = asyncio.create_task(_log_compactor())
 
 
 async def shutdown(app):
-    for task_name in ["simulator_task", "payment_task", "fx_task"]:
+    global _txn_fp, _txn_day
+
+    for task_name in ["scheduler_task", "txn_flush_task", "compact_task"]:
         task = getattr(app.state, task_name, None)
         if task:
             task.cancel()
@@ -457,3 +889,11 @@ async def shutdown(app):
                 await task
             except asyncio.CancelledError:
                 pass
+
+    if _shard_syncs:
+        await asyncio.gather(*_shard_syncs)
+    # Persist anything the flusher hasn't picked up yet
+    if _txn_fp is not None:
+        _txn_fp.close()
+        _txn_fp = None
+        _txn_day = None
@@ -1,15 +1,19 @@
-from fastapi import FastAPI, HTTPException, Header, Query
-from datetime import datetime, timezone
-import os
+import asyncio
+import orjson
+from fastapi import Depends, FastAPI, Query, Response
+from fastapi.responses import StreamingResponse
+from datetime import date
 
 from bank_controller import (
     AccountBalance,
     Transaction,
     FXRate,
-    check_api_key as _check_api_key,
+    check_api_key,
     get_balances as _get_balances,
     get_balance as _get_balance,
     get_transactions as _get_transactions,
+    flush_transactions,
+    iter_transaction_history,
     get_fx_rates as _get_fx_rates,
     startup as bank_startup,
     shutdown as bank_shutdown,
@@ -19,10 +23,26 @@ from sensor_controller import (
     startup as sensor_startup,
     shutdown as sensor_shutdown,
     load_web_records,
-    current_warehouse_stock,
+    current_warehouse_stock_json,
 )
 
-app = FastAPI(title="Demo Bank Balances API v2")
+
+class OrjsonResponse(Response):
+    """JSON response encoded with orjson; pre-serialized bytes are sent as-is"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content)
+
+
+# Every route requires the API key (when one is configured)
+app = FastAPI(
+    title="Demo Bank Balances API v2",
+    dependencies=[Depends(check_api_key)],
+)
 
 
 @app.on_event("startup")
@@ -38,69 +58,91 @@ async def shutdown():
     await sensor_shutdown(app)
 
 
-API_KEY = os.environ.get("API_KEY", None)
-
-
-def check_api_key(x_api_key: str | None):
-    # Delegates to bank controller check (keeps behavior)
-    _check_api_key(x_api_key)
-
-
-@app.get("/balances", response_model=list[AccountBalance])
-async def get_balances(x_api_key: str | None = Header(None)):
+# /balances and /fx/rates return pre-serialized bytes cached in the controller
+@app.get(
+    "/balances",
+    response_model=None,
+    responses={200: {"model": list[AccountBalance]}},
+)
+async def get_balances():
     """Returns current balances for all bank accounts in the system. Includes account identifiers,
     names, currencies, and last update timestamps."""
-    check_api_key(x_api_key)
-    return _get_balances()
+    return OrjsonResponse(_get_balances())
 
 
-@app.get("/balances/{account_id}", response_model=AccountBalance)
-async def get_balance(account_id: str, x_api_key: str | None = Header(None)):
+# Built from our own account state, so skip response_model validation like
+# /transactions below
+@app.get(
+    "/balances/{account_id}",
+    response_model=None,
+    responses={200: {"model": AccountBalance}},
+)
+async def get_balance(account_id: str):
     """Returns the current balance for a specific bank account. Includes account details,
     currency, and last update timestamp."""
-    check_api_key(x_api_key)
-    return _get_balance(account_id)
+    return OrjsonResponse(_get_balance(account_id))
 
 
-@app.get("/transactions", response_model=list[Transaction])
+# Transactions, occupancy and web traffic are read back from our own logs, so skip
+# response_model validation and jsonable_encoder by handing the dicts straight to
+# OrjsonResponse. The transaction schema is kept for the docs.
+@app.get(
+    "/transactions",
+    response_model=None,
+    responses={200: {"model": list[Transaction]}},
+)
 async def get_transactions(
     account_id: str | None = None,
-    limit: int = Query(100, le=1000),
-    x_api_key: str | None = Header(None),
+    limit: int = Query(100, ge=0, le=1000),
 ):
     """Returns transaction history showing debits and credits across accounts. Can be filtered
     by account. Each record includes amount, type, description, and resulting balance.
     """
-    check_api_key(x_api_key)
-    return _get_transactions(account_id=account_id, limit=limit)
+    return OrjsonResponse(_get_transactions(account_id=account_id, limit=limit))
 
 
-@app.get("/fx/rates", response_model=list[FXRate])
-async def get_fx_rates(x_api_key: str | None = Header(None)):
+# Starlette iterates the sync generator in its threadpool, so the file reads
+# don't block the event loop. Buffered transactions are flushed here, on the
+# loop, so the generator never touches the shared append stream.
+@app.get("/transactions/history")
+async def get_transaction_history(since: date | None = None):
+    """Streams the transaction log as newline-delimited JSON, oldest first. Use this for
+    history beyond what /transactions keeps in memory; `since` (UTC date) skips older days.
+    """
+    flush_transactions()
+    return StreamingResponse(
+        iter_transaction_history(since), media_type="application/x-ndjson"
+    )
+
+
+@app.get(
+    "/fx/rates",
+    response_model=None,
+    responses={200: {"model": list[FXRate]}},
+)
+async def get_fx_rates():
     """Returns current foreign exchange rates between supported currency pairs. Each rate
     includes source/target currencies and last update timestamp."""
-    check_api_key(x_api_key)
-    return _get_fx_rates()
+    return OrjsonResponse(_get_fx_rates())
 
 
+# The sensor logs are read in a worker thread; the first read parses the
+# whole file
 @app.get("/occupancy")
-async def get_occupancy(x_api_key: str | None = Header(None)):
+async def get_occupancy():
     """Return office occupancy records collected over time. Each record shows staff count and
     max capacity per office location, with data points collected every 15 minutes."""
-    check_api_key(x_api_key)
-    return load_sensor_records()
+    return OrjsonResponse(await asyncio.to_thread(load_sensor_records))
 
 
 @app.get("/web-traffic")
-async def get_web_traffic(x_api_key: str | None = Header(None)):
+async def get_web_traffic():
     """Return web traffic metrics (website clicks, email volume, call center volume)."""
-    check_api_key(x_api_key)
-    return load_web_records()
+    return OrjsonResponse(await asyncio.to_thread(load_web_records))
 
 
 @app.get("/warehouse-stock")
-async def get_warehouse_stock(x_api_key: str | None = Header(None)):
+async def get_warehouse_stock():
     """Return simulated current warehouse stock for fixed product categories.
-    This data is generated on each request and isn't persisted to disk."""
-    check_api_key(x_api_key)
-    return current_warehouse_stock()
+    This data is regenerated at most every few seconds and isn't persisted to disk."""
+    return OrjsonResponse(current_warehouse_stock_json())
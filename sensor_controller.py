@@ -1,6 +1,9 @@
 import asyncio
 import random
-import json
+import os
+import threading
+import time
+import orjson
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import List
@@ -11,6 +14,12 @@ DATA_DIR.mkdir(exist_ok=True)
 SENSORS_FILE = DATA_DIR / "sensors.jsonl"
 WEB_FILE = DATA_DIR / "web.jsonl"
 
+SENSOR_INTERVAL = 15 * 60  # seconds
+
+# Append streams for the two logs, open between startup() and shutdown()
+_sensors_fp = None
+_web_fp = None
+
 
 OFFICES = [
     "Wollongong - Head Office",
@@ -25,18 +34,52 @@ OFFICES = [
 ]
 
 
-def current_slot_weight(hour: int, office: str) -> float:
-    """Return a weight multiplier for expected occupancy based on hour and office."""
+# Each office has a nominal capacity, matched on a substring of its name
+_CAPACITY_MAP = {
+    "Head Office": 200,
+    "Sales Hub": 120,
+    "Regional Office": 80,
+    "Support Centre": 60,
+    "Field Team": 30,
+    "NZ Branch": 50,
+    "US Sales": 90,
+    "EMEA Office": 70,
+}
+
+
+def _nominal_capacity(office: str) -> int:
+    for key in _CAPACITY_MAP:
+        if key in office:
+            return _CAPACITY_MAP[key]
+    return 50
+
+
+def _hour_slot(hour: int) -> tuple[float, float]:
+    """(base occupancy weight, variance fraction) for an hour of the day"""
     # Day parts:
     # 6-9 rising, 9-15 steady, 15-19 falling, night otherwise
     if 6 <= hour < 9:
-        base = 0.6
+        return 0.6, 0.25
     elif 9 <= hour < 15:
-        base = 0.9
+        return 0.9, 0.1
     elif 15 <= hour < 19:
-        base = 0.5
+        return 0.5, 0.2
     else:
-        base = 0.05
+        return 0.05, 0.05
+
+
+def _web_time_range(hour: int) -> tuple[float, float]:
+    """Range for the web traffic time-of-day weight (business hours ~8 hours)"""
+    if 8 <= hour < 16:  # Business hours
+        return 0.8, 1.5
+    elif 6 <= hour < 8 or 16 <= hour < 18:  # Shoulder periods
+        return 0.3, 0.8
+    else:  # Off hours
+        return 0.05, 0.2
+
+
+def _slot_weight(hour: int, office: str) -> float:
+    base = _hour_slot(hour)[0]
 
     # Some offices (HQ, Sales hubs) have higher occupancy
     if "Head" in office or "Sales" in office:
@@ -48,54 +91,62 @@ def current_slot_weight(hour: int, office: str) -> float:
     return max(0.0, min(1.0, base))
 
 
-def simulate_office_record(office: str) -> dict:
-    """Simulate occupancy for a single office at current time."""
-    now = datetime.now(timezone.utc)
-    local_hour = (
-        now.hour
-    )  # Using UTC hour is acceptable for simulation; could be extended
-    weight = current_slot_weight(local_hour, office)
-
-    # Each office has a nominal capacity
-    capacity_map = {
-        "Head Office": 200,
-        "Sales Hub": 120,
-        "Regional Office": 80,
-        "Support Centre": 60,
-        "Field Team": 30,
-        "NZ Branch": 50,
-        "US Sales": 90,
-        "EMEA Office": 70,
-    }
-
-    nominal = 50
-    for key in capacity_map:
-        if key in office:
-            nominal = capacity_map[key]
-            break
-
+def _occupancy_range(nominal: int, weight: float, hour: int) -> tuple[int, int, int]:
+    """(low, high, mean) headcount for an office at an hour of the day"""
     # Introduce randomness around the weighted nominal
     mean = int(nominal * weight)
     # During high ramp up hours, increase variance positive
-    if 6 <= local_hour < 9:
-        variance = int(nominal * 0.25)
-    elif 9 <= local_hour < 15:
-        variance = int(nominal * 0.1)
-    elif 15 <= local_hour < 19:
-        variance = int(nominal * 0.2)
-    else:
-        variance = int(nominal * 0.05)
+    variance = int(nominal * _hour_slot(hour)[1])
+    return max(0, mean - variance), min(nominal, mean + variance), mean
+
+
+def _build_office_meta(office: str) -> tuple[int, tuple[float, ...], tuple]:
+    nominal = _nominal_capacity(office)
+    weights = tuple(_slot_weight(h, office) for h in range(24))
+    ranges = tuple(_occupancy_range(nominal, weights[h], h) for h in range(24))
+    return nominal, weights, ranges
+
+
+# Lookup tables so the per-record simulation is one table lookup and one RNG
+# draw: office -> (nominal capacity, occupancy weight for each hour of the day,
+# (low, high, mean) headcount for each hour of the day)
+OFFICE_META: dict[str, tuple[int, tuple[float, ...], tuple]] = {
+    office: _build_office_meta(office) for office in OFFICES
+}
+_WEB_TIME_RANGES = tuple(_web_time_range(h) for h in range(24))
 
-    count = max(
-        0, random.randint(max(0, mean - variance), min(nominal, mean + variance))
-    )
+
+def _office_meta(office: str) -> tuple[int, tuple[float, ...], tuple]:
+    meta = OFFICE_META.get(office)
+    if meta is None:
+        meta = _build_office_meta(office)
+    return meta
+
+
+def current_slot_weight(hour: int, office: str) -> float:
+    """Return a weight multiplier for expected occupancy based on hour and office."""
+    return _office_meta(office)[1][hour]
+
+
+def simulate_office_record(office: str, now: datetime | None = None) -> dict:
+    """Simulate occupancy for a single office at `now` (default: current time)."""
+    if now is None:
+        now = datetime.now(timezone.utc)
+    local_hour = (
+        now.hour
+    )  # Using UTC hour is acceptable for simulation; could be extended
+    nominal, _, ranges = _office_meta(office)
+    low, high, mean = ranges[local_hour]
+
+    count = random.randint(low, high)
 
     # Occasionally, night-activity: a few offices have 1-5 staff
     if mean == 0 and random.random() < 0.02:
         count = random.randint(1, 5)
 
     return {
-        "timestamp": now.isoformat(),
+        # Left as a datetime; orjson writes the same ISO 8601 string
+        "timestamp": now,
         "office": office,
         "occupancy": count,
         "capacity": nominal,
@@ -105,51 +156,80 @@ def simulate_office_record(office: str) -> dict:
 async def sensor_job():
     try:
         while True:
-            # Run every 15 minutes
+            # Run every 15 minutes; all records in a tick share one timestamp
             now = datetime.now(timezone.utc)
 
             # Generate and save occupancy records
-            records = [simulate_office_record(o) for o in OFFICES]
-            with open(SENSORS_FILE, "a", encoding="utf-8") as f:
-                for r in records:
-                    f.write(json.dumps(r) + "\n")
+            records = [simulate_office_record(o, now) for o in OFFICES]
+            _sensors_fp.write(b"".join(orjson.dumps(r) + b"\n" for r in records))
+            # Flush so the load_* readers see this tick's records
+            _sensors_fp.flush()
 
             # Maybe generate and save web traffic (33.33% chance)
-            web_record = simulate_web_traffic()
+            web_record = simulate_web_traffic(now)
             if web_record:
-                with open(WEB_FILE, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(web_record) + "\n")
+                _web_fp.write(orjson.dumps(web_record) + b"\n")
+                _web_fp.flush()
 
             # Sleep until next 15-minute boundary to keep timing aligned
-            await asyncio.sleep(15 * 60)
+            # (computed from the wall clock so the interval doesn't drift)
+            wall = time.time()
+            await asyncio.sleep((wall // SENSOR_INTERVAL + 1) * SENSOR_INTERVAL - wall)
     except asyncio.CancelledError:
         return
 
 
+def _read_new_records(path: Path, cache: List[dict], offset: int) -> int:
+    """Parse complete lines appended to `path` since byte `offset` into `cache`.
+
+    Returns the offset to resume from next time. If the file shrank (rotated or
+    truncated) the cache is rebuilt from the start.
+    """
+    if not path.exists():
+        cache.clear()
+        return 0
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < offset:
+            cache.clear()
+            offset = 0
+        f.seek(offset)
+        data = f.read()
+    # Leave any partially written trailing line for the next call
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].split(b"\n"):
+        if line.strip():
+            cache.append(orjson.loads(line))
+    return offset + end
+
+
+# Records parsed so far and the byte offset read up to, per log. The load_*
+# functions return these shared lists; callers must not modify them. They are
+# meant to run in worker threads (asyncio.to_thread), so each log's cache and
+# offset are only touched under its lock.
+_sensor_cache: List[dict] = []
+_sensor_offset = 0
+_sensor_lock = threading.Lock()
+_web_cache: List[dict] = []
+_web_offset = 0
+_web_lock = threading.Lock()
+
+
 def load_sensor_records() -> List[dict]:
-    if not SENSORS_FILE.exists():
-        return []
-    out = []
-    with open(SENSORS_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                out.append(json.loads(line))
-    return out
+    global _sensor_offset
+    with _sensor_lock:
+        _sensor_offset = _read_new_records(SENSORS_FILE, _sensor_cache, _sensor_offset)
+    return _sensor_cache
 
 
 def load_web_records() -> List[dict]:
     """Load web traffic records from web.jsonl"""
-    if not WEB_FILE.exists():
-        return []
-    out = []
-    with open(WEB_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                out.append(json.loads(line))
-    return out
+    global _web_offset
+    with _web_lock:
+        _web_offset = _read_new_records(WEB_FILE, _web_cache, _web_offset)
+    return _web_cache
 
 
-def simulate_web_traffic() -> dict | None:
+def simulate_web_traffic(now: datetime | None = None) -> dict | None:
     """Simulate web traffic metrics with day-of-week weighting.
     Returns None 66.67% of the time to achieve desired probability."""
 
@@ -157,7 +237,8 @@ def simulate_web_traffic() -> dict | None:
     if random.random() > 0.3333:
         return None
 
-    now = datetime.now(timezone.utc)
+    if now is None:
+        now = datetime.now(timezone.utc)
     weekday = now.weekday()  # Monday is 0, Sunday is 6
 
     # Base multipliers for different channels
@@ -171,14 +252,8 @@ def simulate_web_traffic() -> dict | None:
     else:  # Sat-Sun
         day_weight = random.uniform(0.1, 0.3)  # Much lower weekend activity
 
-    # Add time-of-day variation (assuming business hours ~8 hours)
-    hour = now.hour
-    if 8 <= hour < 16:  # Business hours
-        time_weight = random.uniform(0.8, 1.5)
-    elif 6 <= hour < 8 or 16 <= hour < 18:  # Shoulder periods
-        time_weight = random.uniform(0.3, 0.8)
-    else:  # Off hours
-        time_weight = random.uniform(0.05, 0.2)
+    # Add time-of-day variation
+    time_weight = random.uniform(*_WEB_TIME_RANGES[now.hour])
 
     # Combine weights and add high variance
     weight = day_weight * time_weight
@@ -192,7 +267,7 @@ def simulate_web_traffic() -> dict | None:
         "website_clicks": clicks,
         "emails": emails,
         "calls": calls,
-        "timestamp": now.isoformat(),
+        "timestamp": now,
     }
 
 
@@ -214,6 +289,27 @@ _warehouse_state = {
 }
 
 
+# Last serialized snapshot as (monotonic time, JSON bytes) so that clients polling
+# /warehouse-stock don't regenerate (and drift) the data on every request.
+WAREHOUSE_STOCK_TTL = 5.0  # seconds
+_stock_cache: tuple[float, bytes | None] = (0.0, None)
+
+
+def current_warehouse_stock_json() -> bytes:
+    """Return the current warehouse stock as JSON, regenerated at most once per
+    WAREHOUSE_STOCK_TTL seconds."""
+    global _stock_cache
+
+    now = time.monotonic()
+    cached_at, payload = _stock_cache
+    if payload is not None and now - cached_at < WAREHOUSE_STOCK_TTL:
+        return payload
+
+    payload = orjson.dumps(current_warehouse_stock())
+    _stock_cache = (now, payload)
+    return payload
+
+
 def current_warehouse_stock() -> dict:
     """Simulate current warehouse stock for fixed categories.
 
@@ -265,11 +361,18 @@ def current_warehouse_stock() -> dict:
 
 
 async def startup(app):
+    global _sensors_fp, _web_fp
+
+    _sensors_fp = open(SENSORS_FILE, "ab")
+    _web_fp = open(WEB_FILE, "ab")
+
     # Start background sensor job
     app.state.sensor_task = asyncio.create_task(sensor_job())
 
 
 async def shutdown(app):
+    global _sensors_fp, _web_fp
+
     task = getattr(app.state, "sensor_task", None)
     if task:
         task.cancel()
@@ -277,3 +380,8 @@ async def shutdown(app):
             await task
         except asyncio.CancelledError:
             pass
+
+    for fp in (_sensors_fp, _web_fp):
+        if fp is not None:
+            fp.close()
+    _sensors_fp = _web_fp = None
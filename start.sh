@@ -8,5 +8,5 @@ VENV_DIR="${PROJECT_DIR}/venv"
 # activate venv
 source "${VENV_DIR}/bin/activate"
 
-# run uvicorn on LAN, port 2900
-exec uvicorn main:app --host 0.0.0.0 --port 2900 --workers 1
+# run uvicorn on LAN, port 2900 (uvloop event loop, see requirements.txt)
+exec uvicorn main:app --host 0.0.0.0 --port 2900 --workers 1 --loop uvloop